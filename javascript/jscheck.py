@@ -0,0 +1,20 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import argparse
+import jsparser
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares pretty printed javascript files with their expected output')
+    parser.add_argument('js', nargs='+', help='a js file with its expected output in a .out file next to it')
+    args = parser.parse_args()
+    rules = jsparser.Rules()
+    failed = False
+    for js in args.js:
+        with open(os.path.splitext(js)[0] + '.out') as outfile:
+            expected = outfile.read()
+        if jsparser.loadfile(js).pretty(rules) + '\n' != expected:
+            print('Differs from expected output: ' + js)
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -1,43 +1,132 @@
 #!/usr/bin/python3
 
+import sys
+import os
 import json
+import hashlib
 import argparse
 from pyjsparser import parse
 
 class Rules:
+    indentmark = 1
+    dedentmark = -1
+
     def __init__(self):
         self.indent = '    '
-        self.reqsm = [ Operation, Operand, Modifier, ConditionalExpression, Call, Action, VariableDeclaration, Object, Combinator ]
-
-    def applyindent(self, code):
-        lines = code.split('\n')
-        if lines[-1] == '':
-            lines = [ *(map(lambda x: self.indent+x, lines[:-1])) , lines[-1] ]
-        else:
-            lines = list(map(lambda x: self.indent+x, lines))
-        return '\n'.join(lines)
 
-    def endmark(self, stmt):
-        if stmt.__class__ in self.reqsm:
-            return ';\n'
-        return ''
+    @property
+    def indent(self):
+        return self.levels[1]
+
+    @indent.setter
+    def indent(self, indent):
+        self.levels = tuple( indent * i for i in range(64) )
+        self.breaks = tuple( '\n' + x for x in self.levels )
+
+    def level(self, depth):
+        try:
+            return self.levels[depth]
+        except IndexError:
+            self.grow(depth)
+            return self.levels[depth]
+
+    def linebreak(self, depth):
+        try:
+            return self.breaks[depth]
+        except IndexError:
+            self.grow(depth)
+            return self.breaks[depth]
+
+    def grow(self, depth):
+        levels = tuple( self.indent * i for i in range(len(self.levels), 2 * depth + 1) )
+        self.levels += levels
+        self.breaks += tuple( '\n' + x for x in levels )
+
+    def render(self, out):
+        text = []
+        append = text.append
+        depth = 0
+        linestart = False
+        start = 0
+        for i in [ i for i, s in enumerate(out) if type(s) is int ]:
+            code = ''.join(out[start:i])
+            if code != '':
+                linestart = self.indentrun(code, depth, linestart, append)
+            depth += out[i]
+            start = i + 1
+        code = ''.join(out[start:])
+        if code != '':
+            self.indentrun(code, depth, linestart, append)
+        return ''.join(text)
+
+    def indentrun(self, code, depth, linestart, append):
+        if depth > 0:
+            if linestart:
+                append(self.level(depth))
+            if code[-1] == '\n':
+                code = code[:-1].replace('\n', self.linebreak(depth)) + '\n'
+            else:
+                code = code.replace('\n', self.linebreak(depth))
+        append(code)
+        return code[-1] == '\n'
 
     def objnameembrace(self, callee):
-        if callee.__class__ in [ Operand ]:
-            return False
-        return True
+        return type(callee) is not Operand
+
+    def emitindented(self, stmt, out):
+        out.append(self.indentmark)
+        stmt.emit(self, out)
+        out.append(stmt.endmark)
+        out.append(self.dedentmark)
 
 def checknode(node, keys, nodetype = None):
     if nodetype != None and node['type'] != nodetype:
         raise Exception('Mismatched node type ' + node['type'] + ' (should be ' + nodetype + ')')
-    if isinstance(keys, str):
-        keys = [ keys ]
-    keys.append('type')
-    for k in node.keys():
-        if k not in keys:
-            raise Exception('Unknown key ' + k)
-
-class Operand:
+    if not node.keys() <= keys:
+        raise Exception('Unknown key ' + next(iter(node.keys() - keys)))
+
+def nodekeys(*keys):
+    return frozenset(keys + ('type',))
+
+NOKEYS = nodekeys()
+NOKIDS = ()
+NAMEKEYS = nodekeys('name')
+BODYKEYS = nodekeys('body')
+ARGUMENTKEYS = nodekeys('argument')
+LABELKEYS = nodekeys('label')
+EXPRSTMTKEYS = nodekeys('expression')
+VARDECLKEYS = nodekeys('declarations', 'kind')
+VARDECLARATORKEYS = nodekeys('id', 'init')
+CONDITIONALKEYS = nodekeys('test', 'consequent', 'alternate')
+TRYKEYS = nodekeys('block', 'handler', 'guardedHandlers', 'handlers', 'finalizer')
+CATCHKEYS = nodekeys('param', 'body')
+FORKEYS = nodekeys('init', 'test', 'update', 'body')
+FORINKEYS = nodekeys('left', 'right', 'each', 'body')
+WHILEKEYS = nodekeys('test', 'body')
+FUNCTIONKEYS = nodekeys('id', 'params', 'defaults', 'body', 'generator', 'expression')
+CALLKEYS = nodekeys('callee', 'arguments')
+OBJECTKEYS = nodekeys('properties')
+PROPERTYKEYS = nodekeys('key', 'computed', 'value', 'kind', 'method', 'shorthand')
+KEYLITERALKEYS = nodekeys('value', 'raw')
+LITERALKEYS = nodekeys('value', 'raw', 'regex')
+MEMBERKEYS = nodekeys('computed', 'object', 'property')
+BINARYKEYS = nodekeys('operator', 'left', 'right')
+MODIFIERKEYS = nodekeys('operator', 'argument', 'prefix')
+ELEMENTSKEYS = nodekeys('elements')
+EXPRESSIONSKEYS = nodekeys('expressions')
+
+class Node:
+    __slots__ = ()
+    endmark = ''
+
+    def pretty(self, rules):
+        out = []
+        self.emit(rules, out)
+        return rules.render(out)
+
+class Operand(Node):
+    __slots__ = ('kind', 'value', 'raw', 'text')
+    endmark = ';\n'
     literal = 1
     identifier = 2
     parameter = 3
@@ -48,220 +137,282 @@ class Operand:
         self.kind = kind
         self.value = value
         self.raw = raw
+        if kind == Operand.regex:
+            self.text = '(' + raw + ')'
+        else:
+            self.text = raw
 
-    def pretty(self, rules):
-        if self.kind == Operand.regex:
-            return '(' + self.raw + ')'
-        return self.raw
-
-class Operation:
-    general = 1
-    assignment = 2
-    dotmember = 3
-    bracketmember = 4
-    logical = 5
-
-    def __init__(self, operator, left, right, kind = general):
+    def emit(self, rules, out):
+        out.append(self.text)
+
+THISOPERAND = Operand(Operand.this, 'this', 'this')
+
+class Operation(Node):
+    __slots__ = ('operator', 'left', 'right')
+    endmark = ';\n'
+
+    def __init__(self, operator, left, right):
         self.operator = operator
         self.left = left
         self.right = right
-        self.kind = kind
 
     @classmethod
-    def prettyoperand(cls, op, rules):
-        if isinstance(op, Operand):
-            return op.pretty(rules)
+    def emitoperand(cls, op, rules, out):
+        if type(op) is Operand:
+            op.emit(rules, out)
+        else:
+            out.append('(')
+            op.emit(rules, out)
+            out.append(')')
+
+class GeneralOperation(Operation):
+    __slots__ = ()
+
+    def emit(self, rules, out):
+        Operation.emitoperand(self.left, rules, out)
+        out.append(' ')
+        out.append(self.operator)
+        out.append(' ')
+        Operation.emitoperand(self.right, rules, out)
+
+class LogicalOperation(GeneralOperation):
+    __slots__ = ()
+
+class Assignment(Operation):
+    __slots__ = ()
+
+    def emit(self, rules, out):
+        self.left.emit(rules, out)
+        out.append(' ')
+        out.append(self.operator)
+        out.append(' ')
+        self.right.emit(rules, out)
+
+class DotMember(Operation):
+    __slots__ = ()
+
+    def __init__(self, left, right):
+        Operation.__init__(self, '.', left, right)
+
+    def emit(self, rules, out):
+        if rules.objnameembrace(self.left):
+            out.append('(')
+            self.left.emit(rules, out)
+            out.append(').')
         else:
-            return '(' + op.pretty(rules) + ')'
+            self.left.emit(rules, out)
+            out.append('.')
+        self.right.emit(rules, out)
 
-    def pretty(self, rules):
-        if self.kind == Operation.assignment:
-            return self.left.pretty(rules) + ' ' + self.operator + ' ' + self.right.pretty(rules)
-        elif self.kind == Operation.dotmember:
-            if rules.objnameembrace(self.left):
-                return '(' + self.left.pretty(rules) + ').' + self.right.pretty(rules)
-            else:
-                return self.left.pretty(rules) + '.' + self.right.pretty(rules)
-        elif self.kind == Operation.bracketmember:
-            if rules.objnameembrace(self.left):
-                return '(' + self.left.pretty(rules) + ')[' + self.right.pretty(rules) + ']'
-            else:
-                return self.left.pretty(rules) + '[' + self.right.pretty(rules) + ']'
-        return Operation.prettyoperand(self.left, rules) + ' ' + self.operator + ' ' + Operation.prettyoperand(self.right, rules)
+class BracketMember(Operation):
+    __slots__ = ()
+
+    def __init__(self, left, right):
+        Operation.__init__(self, '.', left, right)
+
+    def emit(self, rules, out):
+        if rules.objnameembrace(self.left):
+            out.append('(')
+            self.left.emit(rules, out)
+            out.append(')[')
+        else:
+            self.left.emit(rules, out)
+            out.append('[')
+        self.right.emit(rules, out)
+        out.append(']')
+
+class Modifier(Node):
+    __slots__ = ('operator', 'argument', 'prefix')
+    endmark = ';\n'
 
-class Modifier:
     def __init__(self, operator, argument, prefix):
         self.operator = operator
         self.argument = argument
         self.prefix = prefix
 
-    def pretty(self, rules):
+    def emit(self, rules, out):
         if len(self.operator) > 2:
             delim = ' '
         else:
             delim = ''
         if self.prefix:
-            return self.operator + delim + Operation.prettyoperand(self.argument, rules)
+            out.append(self.operator)
+            out.append(delim)
+            Operation.emitoperand(self.argument, rules, out)
         else:
-            return Operation.prettyoperand(self.argument, rules) + delim + self.operator
+            Operation.emitoperand(self.argument, rules, out)
+            out.append(delim)
+            out.append(self.operator)
+
+class ConditionalExpression(Node):
+    __slots__ = ('test', 'consequent', 'alternate')
+    endmark = ';\n'
 
-class ConditionalExpression:
     def __init__(self, test, consequent, alternate):
         self.test = test
         self.consequent = consequent
         self.alternate = alternate
 
-    def pretty(self, rules):
-        return '(' + self.test.pretty(rules) + ') ? ' + Operation.prettyoperand(self.consequent, rules) + ' : ' + Operation.prettyoperand(self.alternate, rules)
+    def emit(self, rules, out):
+        out.append('(')
+        self.test.emit(rules, out)
+        out.append(') ? ')
+        Operation.emitoperand(self.consequent, rules, out)
+        out.append(' : ')
+        Operation.emitoperand(self.alternate, rules, out)
 
-class ConditionalStatement:
+class ConditionalStatement(Node):
+    __slots__ = ('test', 'consequent', 'alternate')
     def __init__(self, test, consequent, alternate):
         self.test = test
         self.consequent = consequent
         self.alternate = alternate
 
-    def pretty(self, rules):
-        buf = 'if ( ' + self.test.pretty(rules) + ' )\n'
-        buf += rules.applyindent( self.consequent.pretty(rules) + rules.endmark(self.consequent) )
+    def emit(self, rules, out):
+        out.append('if ( ')
+        self.test.emit(rules, out)
+        out.append(' )\n')
+        rules.emitindented(self.consequent, out)
         if self.alternate != None:
-            buf += 'else\n'
-            buf += rules.applyindent( self.alternate.pretty(rules) + rules.endmark(self.alternate) )
-        return buf
+            out.append('else\n')
+            rules.emitindented(self.alternate, out)
 
-class Handler:
+class Handler(Node):
+    __slots__ = ('block', 'param', 'catcher', 'finalizer')
     def __init__(self):
         self.block = None
         self.param = None
         self.catcher = None
         self.finalizer = None
 
-    def pretty(self, rules):
-        buf = 'try\n' + rules.applyindent( self.block.pretty(rules) + rules.endmark(self.block) )
+    def emit(self, rules, out):
+        out.append('try\n')
+        rules.emitindented(self.block, out)
         if self.catcher != None:
-            buf += 'catch ( ' + self.param + ' )\n' + rules.applyindent( self.catcher.pretty(rules) + rules.endmark(self.catcher) )
+            out.append('catch ( ')
+            out.append(self.param)
+            out.append(' )\n')
+            rules.emitindented(self.catcher, out)
         if self.finalizer != None:
-            buf += 'finally \n' + rules.applyindent( self.finalizer.pretty(rules) + rules.endmark(self.finalizer) )
-        return buf
+            out.append('finally \n')
+            rules.emitindented(self.finalizer, out)
 
     @classmethod
-    def load(cls, astnode):
-        checknode(astnode, ['block', 'handler', 'guardedHandlers', 'handlers', 'finalizer'])
-        checknode(astnode['block'], 'body', nodetype = 'BlockStatement')
-        if not (isinstance(astnode['guardedHandlers'], list) and len(astnode['guardedHandlers']) == 0):
+    def check(cls, astnode, handler, finalizer):
+        checknode(astnode['block'], BODYKEYS, nodetype = 'BlockStatement')
+        if astnode['guardedHandlers'] != []:
             raise Exception ('Bad guardedHandlers in try-catch')
-        handler = cls()
-        handler.block = Block.load(astnode['block']['body'])
-        if astnode['handler'] != None:
+        if handler != None:
             if len(astnode['handlers']) != 1:
                 raise Exception('Handlers array is of unusual size in try-catch')
-            checknode(astnode['handler'], ['param','body'], nodetype = 'CatchClause')
-            checknode(astnode['handler']['param'], 'name', nodetype = 'Identifier')
-            checknode(astnode['handler']['body'], 'body', nodetype = 'BlockStatement')
+            checknode(handler, CATCHKEYS, nodetype = 'CatchClause')
+            checknode(handler['param'], NAMEKEYS, nodetype = 'Identifier')
+            checknode(handler['body'], BODYKEYS, nodetype = 'BlockStatement')
+        elif len(astnode['handlers']) > 0:
+            raise Exception('Handlers array is not empty in try-catch')
+        if finalizer != None:
+            checknode(finalizer, BODYKEYS, nodetype = 'BlockStatement')
+
+    @classmethod
+    def expand(cls, astnode):
+        handler = astnode['handler']
+        finalizer = astnode['finalizer']
+        if __debug__:
+            cls.check(astnode, handler, finalizer)
+        return ( astnode['block'], handler['body'] if handler != None else None, finalizer )
+
+    @classmethod
+    def build(cls, astnode, kids):
+        handler = cls()
+        handler.block, handler.catcher, handler.finalizer = kids
+        if astnode['handler'] != None:
             handler.param = astnode['handler']['param']['name']
-            handler.catcher = Block.load( astnode['handler']['body']['body'] )
-        else:
-            if len(astnode['handlers']) > 0:
-                raise Exception('Handlers array is not empty in try-catch')
-        if astnode['finalizer'] != None:
-            checknode(astnode['finalizer'], 'body', nodetype = 'BlockStatement')
-            handler.finalizer = Block.load( astnode['finalizer']['body'] )
         return handler
 
-class Block:
+class Block(Node):
+    __slots__ = ('statements', 'top')
     def __init__(self):
-        self.vardecl = []
-        self.exprs = []
-        self.funcs = []
         self.statements = []
         self.top = False
 
-    def pretty(self, rules):
-        buf = ''
+    @property
+    def vardecl(self):
+        return [ s for s in self.statements if type(s) is VariableDeclaration ]
+
+    @property
+    def funcs(self):
+        return [ s for s in self.statements if type(s) is Function and s.kind == Function.declaration ]
+
+    @property
+    def exprs(self):
+        return [ s for s in self.statements if type(s) is not VariableDeclaration and not (type(s) is Function and s.kind == Function.declaration) ]
+
+    def emit(self, rules, out):
+        if not self.top:
+            out.append('{\n')
+            out.append(rules.indentmark)
         for s in self.statements:
-            buf += s.pretty(rules) + rules.endmark(s)
+            s.emit(rules, out)
+            out.append(s.endmark)
         if not self.top:
-            buf = '{\n' + rules.applyindent(buf) + '}\n'
-        return buf
-
-    checks = { 'VariableDeclaration':['declarations', 'kind'], 'ExpressionStatement':'expression', 'FunctionDeclaration':None,
-               'EmptyStatement':[], 'ReturnStatement':'argument', 'IfStatement':['test','consequent','alternate'],
-               'BlockStatement':'body', 'ThrowStatement':'argument', 'ForStatement':None,  'ForInStatement':None, 
-               'BreakStatement': 'label', 'ContinueStatement': 'label', 'WhileStatement':None, 'DoWhileStatement':None,
-               'TryStatement':None}
-    loads = { 'VariableDeclaration': lambda x: Block.loadvardecl(x) , 'ExpressionStatement': lambda x: Expression.load(x['expression']),
-              'FunctionDeclaration': lambda x: Function.load(x, Function.declaration), 'EmptyStatement': lambda x: Expression(),
-              'ReturnStatement': lambda x: Action(Expression.load(x['argument']) if x['argument']!=None else None, kind=Action.Return),
-              'IfStatement':lambda x: Block.loadconditional(x),
-              'BlockStatement': lambda x: Block.load(x['body']), 'ThrowStatement': lambda x: Action(Expression.load(x['argument']), kind=Action.Throw),
-              'ForStatement':lambda x: Loop.loadfor(x), 'ForInStatement':lambda x: Iterator.load(x),
-              'BreakStatement': lambda x: Block.loadcontrol(x, Action.Break), 'ContinueStatement': lambda x: Block.loadcontrol(x, Action.Continue),
-              'WhileStatement':lambda x: Loop.loadwhile(x, Loop.While), 'DoWhileStatement':lambda x: Loop.loadwhile(x, Loop.DoWhile),
-              'TryStatement': Handler.load }
+            out.append(rules.dedentmark)
+            out.append('}\n')
 
     @classmethod
     def load(cls, astnode):
-        block = Block()
-        dispatch = { 'VariableDeclaration': 'vardecl', 'ExpressionStatement':'exprs', 'FunctionDeclaration':'funcs', 'EmptyStatement':'exprs',
-                    'ReturnStatement':'exprs',  'ThrowStatement':'exprs', 'IfStatement':'exprs', 'BlockStatement': 'exprs', 'ForStatement':'exprs',
-                    'ForInStatement':'exprs', 'BreakStatement':'exprs', 'ContinueStatement':'exprs', 'WhileStatement':'exprs', 'DoWhileStatement':'exprs',
-                    'TryStatement':'exprs'}
-        for x in astnode:
-            xtype = x['type']
-            stmt = cls.loadstatement(x)
-            if not isinstance(stmt, list):
-                stmt = [ stmt ]
-            getattr(block, dispatch[x['type']]).extend(stmt)
-            block.statements.extend(stmt)
-        return block
+        return cls.build(loadnodes(astnode))
 
     @classmethod
-    def loadstatement(cls, astnode):
-        xtype = astnode['type']
-        if xtype in cls.checks:
-            if cls.checks[xtype] != None:
-                checknode(astnode, cls.checks[xtype])
-        else:
-            print(astnode)
-            raise Exception('Unknown block statement ' + xtype)
-        return cls.loads[xtype](astnode)
+    def build(cls, kids):
+        block = Block()
+        append = block.statements.append
+        extend = block.statements.extend
+        for stmt in kids:
+            if type(stmt) is list:
+                extend(stmt)
+            else:
+                append(stmt)
+        return block
 
     @classmethod
-    def loadvardecl(cls, x):
-        vds = []
-        for vdn in x['declarations']:
-            vds.append( VariableDeclaration.load(vdn, x['kind']) )
-        return vds
+    def expandvardecl(cls, x):
+        return [ VariableDeclaration.expand(vdn) for vdn in x['declarations'] ]
 
     @classmethod
-    def loadconditional(cls, x):
-        return ConditionalStatement( Expression.load(x['test']), Block.loadstatement(x['consequent']),
-                                     None if x['alternate'] == None else Block.loadstatement(x['alternate']) )
+    def buildvardecl(cls, x, kids):
+        return [ VariableDeclaration.build(vdn, init, x['kind']) for vdn, init in zip(x['declarations'], kids) ]
 
     @classmethod
-    def loadcontrol(cls, astnode, kind):
+    def expandcontrol(cls, astnode):
         if astnode['label'] != None:
             raise Exception(astnode['type'] + ' with labels are unsupported')
-        return Action(None, kind)
+        return NOKIDS
 
-class Iterator:
+class Iterator(Node):
+    __slots__ = ('itervar', 'rangedecl', 'body')
     def __init__(self, itervar, rangedecl, body):
         self.itervar = itervar
         self.rangedecl = rangedecl
         self.body = body
 
-    def pretty(self, rules):
-        buf = 'for(' + self.itervar.pretty(rules) + ' in ' + self.rangedecl.pretty(rules) + ')\n'
-        buf += rules.applyindent( self.body.pretty(rules) + rules.endmark(self.body) )
-        return buf
+    def emit(self, rules, out):
+        out.append('for(')
+        self.itervar.emit(rules, out)
+        out.append(' in ')
+        self.rangedecl.emit(rules, out)
+        out.append(')\n')
+        rules.emitindented(self.body, out)
 
     @classmethod
-    def load(self, astnode):
-        checknode(astnode, ['left','right','each','body'])
+    def expand(cls, astnode):
         if astnode['each']:
             raise Exception("'each' attribute should be false in for-in statement")
-        return Iterator( Expression.load(astnode['left']), Expression.load(astnode['right']), Block.loadstatement(astnode['body']) )
+        if astnode['left']['type'] == 'VariableDeclaration':
+            raise Exception('Declarations in for-in statement are not supported')
+        return ( astnode['left'], astnode['right'], astnode['body'] )
 
-class Loop:
+class Loop(Node):
+    __slots__ = ('kind', 'init', 'test', 'update', 'body')
     For = 1
     While = 2
     DoWhile = 3
@@ -273,53 +424,53 @@ class Loop:
         self.update = None
         self.body = None
 
-    def pretty(self, rules):
+    def emit(self, rules, out):
         if self.kind == Loop.DoWhile:
-            return self.prettydo(rules)
+            return self.emitdo(rules, out)
         if self.kind == Loop.For:
-            buf = 'for(' + ' ,'.join( map(lambda x: x.pretty(rules), self.init)) + '; '
+            out.append('for(')
+            for i, x in enumerate(self.init):
+                if i > 0:
+                    out.append(', ')
+                x.emit(rules, out)
+            out.append('; ')
         else:
-            buf = 'while( ';
+            out.append('while( ')
         if self.test != None:
-            buf += self.test.pretty(rules)
+            self.test.emit(rules, out)
         if self.kind == Loop.For:
-            buf += '; '
+            out.append('; ')
             if self.update != None:
-                buf += self.update.pretty(rules)
-        buf += ')\n'
-        buf += rules.applyindent( self.body.pretty(rules) + rules.endmark(self.body) )
-        return buf
-
-    def prettydo(self, rules):
-        return 'do ' + rules.applyindent( self.body.pretty(rules) + rules.endmark(self.body) ) + 'while( ' + self.test.pretty(rules) + ');\n'
+                self.update.emit(rules, out)
+        out.append(')\n')
+        rules.emitindented(self.body, out)
+
+    def emitdo(self, rules, out):
+        out.append('do ')
+        out.append(rules.indent)
+        rules.emitindented(self.body, out)
+        out.append('while( ')
+        self.test.emit(rules, out)
+        out.append(');\n')
 
     @classmethod
-    def loadfor(cls, astnode):
-        checknode(astnode, ['init','test','update','body'])
+    def buildfor(cls, astnode, kids):
         loop = cls(Loop.For)
-        if astnode['init'] != None:
-            if astnode['init']['type'] == 'VariableDeclaration':
-                checknode( astnode['init'], ['declarations', 'kind'] )
-                loop.init.extend( Block.loadvardecl(astnode['init']) )
-            else:
-                loop.init.append( Expression.load(astnode['init']) )
-        if astnode['test'] != None:
-            loop.test = Expression.load(astnode['test'])
-        if astnode['update'] != None:
-            loop.update = Expression.load(astnode['update'])
-        loop.body = Block.loadstatement(astnode['body'])
+        init, loop.test, loop.update, loop.body = kids
+        if isinstance(init, list):
+            loop.init.extend(init)
+        elif init != None:
+            loop.init.append(init)
         return loop
 
     @classmethod
-    def loadwhile(cls, astnode, kind):
-        checknode(astnode, ['test','body'])
+    def buildwhile(cls, astnode, kids, kind):
         loop = cls(kind)
-        if astnode['test'] != None:
-            loop.test = Expression.load(astnode['test'])
-        loop.body = Block.loadstatement(astnode['body'])
+        loop.test, loop.body = kids
         return loop
 
-class Function:
+class Function(Node):
+    __slots__ = ('name', 'kind', 'params', 'body', 'paramtext')
     declaration = 1
     inline = 2
     objprop = 3
@@ -329,45 +480,58 @@ class Function:
         self.kind = kind
         self.params = []
         self.body = body
+        self.paramtext = None
 
-    def pretty(self, rules):
+    def emit(self, rules, out):
+        if self.kind == Function.inline:
+            out.append('(')
         if self.kind != Function.objprop:
-            buf = 'function'
-        else:
-            buf = ''
+            out.append('function')
         if self.name != None:
-            buf += ' ' + self.name
-        buf += '(' + ','.join( map(lambda x: x.pretty(rules), self.params) ) + ')\n'
-        buf += self.body.pretty(rules)
+            out.append(' ')
+            out.append(self.name)
+        if self.paramtext == None:
+            self.paramtext = '(' + ','.join([ x.text for x in self.params ]) + ')\n'
+        out.append(self.paramtext)
+        self.body.emit(rules, out)
         if self.kind == Function.inline:
-            buf = '(' + buf + ')'
+            out.append(')')
         if self.kind != Function.objprop:
-            buf += '\n'
-        return buf
+            out.append('\n')
 
     @classmethod
-    def load(cls, astnode, decl):
-        checknode(astnode, ['id','params','defaults','body','generator','expression'])
+    def expand(cls, astnode):
         if astnode['id'] != None:
-            checknode(astnode['id'], 'name')
-            funcname = astnode['id']['name']
-        else:
-            funcname = None
+            if __debug__:
+                checknode(astnode['id'], NAMEKEYS)
         if astnode['generator'] or astnode['expression']:
             raise Exception('Generators or expressions are not yet implemented')
-        if len(astnode['defaults']) < 0:
-            raise Exception('Defaults are not yet implemented')
         if astnode['body']['type'] != 'BlockStatement':
             raise Exception('Unknown function body')
-        func = Function(funcname, decl, Block.load(astnode['body']['body']) )
         for p in astnode['params']:
             if p['type'] != 'Identifier':
                 raise Exception('Unsupported parameter ' + p['type'])
-            checknode(p, 'name')
-            func.params.append( Operand(Operand.parameter, p['name'], p['name']) )
+            if __debug__:
+                checknode(p, NAMEKEYS)
+        return astnode['body']['body']
+
+    @classmethod
+    def build(cls, astnode, kids, decl):
+        if astnode['id'] != None:
+            funcname = astnode['id']['name']
+        else:
+            funcname = None
+        func = Function(funcname, decl, Block.build(kids) )
+        append = func.params.append
+        parameter = Operand.parameter
+        for p in astnode['params']:
+            name = p['name']
+            append( Operand(parameter, name, name) )
         return func
 
-class Call:
+class Call(Node):
+    __slots__ = ('kind', 'callee', 'args')
+    endmark = ';\n'
     call = 1
     new = 2
 
@@ -376,24 +540,28 @@ class Call:
         self.callee = callee
         self.args = args
 
-    def pretty(self, rules):
-        buf = ''
+    def emit(self, rules, out):
         if self.kind == Call.new:
-            buf += 'new '
-        buf += self.callee.pretty(rules)
-        return buf + self.args.pretty(rules)
+            out.append('new ')
+        self.callee.emit(rules, out)
+        self.args.emit(rules, out)
+
+    @classmethod
+    def expand(cls, astnode):
+        return ( astnode['callee'], *astnode['arguments'] )
 
     @classmethod
-    def load(cls, astnode, kind):
-        checknode(astnode, ['callee','arguments'] )
-        return Call(Expression.load(astnode['callee']), kind, Combinator.load(astnode['arguments'], '()') )
+    def build(cls, astnode, kids, kind):
+        return Call(kids[0], kind, Combinator.build(kids[1:], '()') )
 
-class Property:
+class Property(Node):
+    __slots__ = ('kind', 'key', 'value')
     init = 1
     shorthand = 2
     method = 3
     setter = 4
     getter = 5
+    affixes = ( None, ('', ' : '), ('', ''), ('', ' '), ('set ', ' '), ('get ', ' ') )
 
     def __init__(self, kind, key, value):
         self.kind = kind
@@ -403,12 +571,13 @@ class Property:
             self.value.kind = Function.objprop
             self.value.name = ''
 
-    def pretty(self, rules):
-        return { Property.init : lambda: self.key + ' : ' + self.value.pretty(rules) ,
-                 Property.shorthand : lambda: self.key ,
-                 Property.method: lambda: self.key + ' ' + self.value.pretty(rules) ,
-                 Property.setter: lambda: 'set ' + self.key + ' ' + self.value.pretty(rules) ,
-                 Property.getter: lambda: 'get ' + self.key + ' ' + self.value.pretty(rules) }[self.kind]()
+    def emit(self, rules, out):
+        head, tail = Property.affixes[self.kind]
+        out.append(head)
+        out.append(self.key)
+        out.append(tail)
+        if self.kind != Property.shorthand:
+            self.value.emit(rules, out)
 
     @classmethod
     def getkind(cls, astnode):
@@ -426,37 +595,58 @@ class Property:
         else:
             raise Exception('Unknown property kind ' + astnode['kind'])
 
-class Object:
+class Object(Node):
+    __slots__ = ('properties',)
+    endmark = ';\n'
+
     def __init__(self):
         self.properties = []
 
-    def pretty(self, rules):
-        buf = ''
+    def emit(self, rules, out):
+        if not self.properties:
+            out.append('{\n}')
+            return
+        out.append('{\n')
+        out.append(rules.indentmark)
         for s in self.properties:
-            buf += s.pretty(rules) + ',\n'
-        buf = '{\n' + rules.applyindent(buf) + '}'
-        return buf
+            s.emit(rules, out)
+            out.append(',\n')
+        out.append(rules.dedentmark)
+        out.append('}')
 
     @classmethod
-    def load(cls, astnode):
-        checknode(astnode, 'properties')
-        obj = Object()
+    def expand(cls, astnode):
         for p in astnode['properties']:
-            checknode(p, ['key', 'computed', 'value', 'kind', 'method', 'shorthand'], nodetype = 'Property')
+            if __debug__:
+                checknode(p, PROPERTYKEYS, nodetype = 'Property')
             if p['key']['type'] == 'Literal':
-                checknode(p['key'], ['value','raw'])
-                key = p['key']['raw']
+                if __debug__:
+                    checknode(p['key'], KEYLITERALKEYS)
             elif p['key']['type'] == 'Identifier':
-                checknode(p['key'], 'name')
-                key = p['key']['name']
+                if __debug__:
+                    checknode(p['key'], NAMEKEYS)
             else:
                 raise Exception ('Wrong type of object property key: ' + p['key']['type'])
             if p['computed']:
                 raise Exception('Computed properties are not supported')
-            obj.properties.append( Property(Property.getkind(p), key, Expression.load(p['value'])) )
+        return [ p['value'] for p in astnode['properties'] ]
+
+    @classmethod
+    def build(cls, astnode, kids):
+        obj = Object()
+        append = obj.properties.append
+        for p, value in zip(astnode['properties'], kids):
+            if p['key']['type'] == 'Literal':
+                key = p['key']['raw']
+            else:
+                key = p['key']['name']
+            append( Property(Property.getkind(p), key, value) )
         return obj
 
-class Combinator:
+class Combinator(Node):
+    __slots__ = ('open', 'close', 'args')
+    endmark = ';\n'
+
     def __init__(self, kind):
         if kind != None:
             self.open = kind[0]
@@ -466,119 +656,220 @@ class Combinator:
             self.close = ''
         self.args = []
 
-    def pretty(self, rules):
-        return self.open + ' ,'.join( map(lambda x: x.pretty(rules), self.args) ) + self.close
+    def emit(self, rules, out):
+        out.append(self.open)
+        if not self.args:
+            out.append(self.close)
+            return
+        if len(self.args) == 1:
+            self.args[0].emit(rules, out)
+            out.append(self.close)
+            return
+        for i, x in enumerate(self.args):
+            if i > 0:
+                out.append(', ')
+            x.emit(rules, out)
+        out.append(self.close)
 
     @classmethod
-    def load(cls, astnode, kind):
+    def build(cls, kids, kind):
         combinator = Combinator(kind)
-        for a in astnode:
-            combinator.args.append( Expression.load(a) )
+        combinator.args.extend(kids)
         return combinator
 
-class Action:
+class Action(Node):
+    __slots__ = ('expression', 'kind')
+    endmark = ';\n'
     Return = 1
     Throw = 2
     Break = 3
     Continue = 4
+    keywords = ( None, 'return', 'throw', 'break', 'continue' )
 
     def __init__(self, expression, kind):
         self.expression = expression
         self.kind = kind
 
-    def pretty(self, rules):
-        buf = { Action.Return:'return', Action.Throw:'throw', Action.Break:'break', Action.Continue:'continue' }[self.kind]
+    def emit(self, rules, out):
+        out.append(self.keywords[self.kind])
         if self.expression != None:
-            buf += ' ' + self.expression.pretty(rules)
-        return buf
-
+            out.append(' ')
+            self.expression.emit(rules, out)
 
-class Expression:
-    def pretty(self, rules):
-        return ''
 
-    binary = { 'BinaryExpression':Operation.general, 'AssignmentExpression':Operation.assignment, 'LogicalExpression':Operation.logical }
-    call = { 'CallExpression':Call.call, 'NewExpression':Call.new }
+class Expression(Node):
+    __slots__ = ()
+    def emit(self, rules, out):
+        pass
 
     @classmethod
     def load(cls, astnode):
-        if astnode['type'] == 'Literal':
-            checknode(astnode, ['value','raw','regex'])
-            return Operand( Operand.regex if 'regex' in astnode else Operand.literal, astnode['value'], astnode['raw'])
-        elif astnode['type'] in cls.call:
-            return Call.load(astnode, cls.call[astnode['type']])
-        elif astnode['type'] == 'FunctionExpression':
-            return Function.load(astnode, Function.inline)
-        elif astnode['type'] == 'MemberExpression':
-            checknode(astnode, ['computed', 'object', 'property'])
-            kind = Operation.bracketmember if astnode['computed'] else Operation.dotmember
-            return Operation('.', Expression.load(astnode['object']), Expression.load(astnode['property']), kind=kind )
-        elif astnode['type'] == 'Identifier':
-            checknode(astnode, 'name')
-            return Operand(Operand.identifier, astnode['name'], astnode['name'])
-        elif astnode['type'] == 'ThisExpression':
-            checknode(astnode, [])
-            return Operand(Operand.this, 'this', 'this')
-        elif astnode['type'] in cls.binary:
-            checknode(astnode, ['operator','left','right'])
-            return Operation( astnode['operator'], Expression.load(astnode['left']), Expression.load(astnode['right']), kind=cls.binary[astnode['type']] )
-        elif astnode['type'] == 'ConditionalExpression':
-            checknode(astnode, ['test', 'consequent', 'alternate'])
-            return ConditionalExpression( Expression.load(astnode['test']), Expression.load(astnode['consequent']), Expression.load(astnode['alternate']) )
-        elif astnode['type'] == 'UnaryExpression' or astnode['type'] == 'UpdateExpression':
-            checknode(astnode, ['operator', 'argument', 'prefix'])
-            return Modifier( astnode['operator'], Expression.load(astnode['argument']), astnode['prefix'] )
-        elif astnode['type'] == 'ArrayExpression':
-            checknode(astnode, 'elements')
-            return Combinator.load(astnode['elements'], '[]')
-        elif astnode['type'] == 'SequenceExpression':
-            checknode(astnode, 'expressions')
-            return Combinator.load(astnode['expressions'], None)
-        elif astnode['type'] == 'ObjectExpression':
-            return Object.load(astnode)
-        else:
-            print(astnode)
-            raise Exception('Unknown expression type ' + astnode['type'])
-        return None
+        return loadnodes([ astnode ])[0]
+
+    @classmethod
+    def buildliteral(cls, astnode, operands):
+        kind = Operand.regex if 'regex' in astnode else Operand.literal
+        raw = astnode['raw']
+        op = operands.get((kind, raw))
+        if op == None:
+            op = operands[(kind, raw)] = Operand(kind, astnode['value'], raw)
+        return op
+
+    @classmethod
+    def buildmember(cls, astnode, kids):
+        if astnode['computed']:
+            return BracketMember(kids[0], kids[1])
+        return DotMember(kids[0], kids[1])
+
+    @classmethod
+    def buildidentifier(cls, astnode, operands):
+        name = astnode['name']
+        op = operands.get((Operand.identifier, name))
+        if op == None:
+            name = sys.intern(name)
+            op = operands[(Operand.identifier, name)] = Operand(Operand.identifier, name, name)
+        return op
+
+class VariableDeclaration(Node):
+    __slots__ = ('id', 'kind', 'expression')
+    endmark = ';\n'
 
-class VariableDeclaration:
     def __init__(self):
         self.id = None
         self.kind = None
         self.expression = None
 
-    def pretty(self, rules):
-        buf = self.kind + ' ' + self.id
+    def emit(self, rules, out):
+        out.append(self.kind)
+        out.append(' ')
+        out.append(self.id)
         if self.expression != None:
-            buf += ' = ' + self.expression.pretty(rules)
-        return buf
+            out.append(' = ')
+            self.expression.emit(rules, out)
 
     @classmethod
-    def load(cls, astnode, kind):
-        checknode(astnode, ['id', 'init'], nodetype = 'VariableDeclarator')
-        checknode(astnode['id'], 'name', nodetype='Identifier')
+    def expand(cls, astnode):
+        if __debug__:
+            checknode(astnode, VARDECLARATORKEYS, nodetype = 'VariableDeclarator')
+            checknode(astnode['id'], NAMEKEYS, nodetype='Identifier')
+        return astnode.get('init')
+
+    @classmethod
+    def build(cls, astnode, init, kind):
         vd = VariableDeclaration()
         vd.id = astnode['id']['name']
         vd.kind = kind
-        if 'init' in astnode and astnode['init'] != None:
-            vd.expression = Expression.load(astnode['init'])
+        vd.expression = init
         return vd
 
-class Program:
+class Program(Node):
+    __slots__ = ('body',)
     def __init__(self, body):
         self.body = body
         self.body.top = True
 
-    def pretty(self, rules):
-        return self.body.pretty(rules)
+    def emit(self, rules, out):
+        self.body.emit(rules, out)
 
     @classmethod
     def load(cls, astnode):
-        checknode(astnode, 'body')
+        if __debug__:
+            checknode(astnode, BODYKEYS)
         return Program( Block.load(astnode['body']) )
 
+def nochildren(astnode):
+    return NOKIDS
+
+LOADS = { 'VariableDeclaration': (VARDECLKEYS, Block.expandvardecl, Block.buildvardecl),
+          'ExpressionStatement': (EXPRSTMTKEYS, lambda x: (x['expression'],), lambda x, kids: kids[0]),
+          'FunctionDeclaration': (FUNCTIONKEYS, Function.expand, lambda x, kids: Function.build(x, kids, Function.declaration)),
+          'EmptyStatement': (NOKEYS, nochildren, lambda x, kids: Expression()),
+          'ReturnStatement': (ARGUMENTKEYS, lambda x: (x['argument'],), lambda x, kids: Action(kids[0], kind=Action.Return)),
+          'IfStatement': (CONDITIONALKEYS, lambda x: (x['test'], x['consequent'], x['alternate']), lambda x, kids: ConditionalStatement(*kids)),
+          'BlockStatement': (BODYKEYS, lambda x: x['body'], lambda x, kids: Block.build(kids)),
+          'ThrowStatement': (ARGUMENTKEYS, lambda x: (x['argument'],), lambda x, kids: Action(kids[0], kind=Action.Throw)),
+          'ForStatement': (FORKEYS, lambda x: (x['init'], x['test'], x['update'], x['body']), Loop.buildfor),
+          'ForInStatement': (FORINKEYS, Iterator.expand, lambda x, kids: Iterator(*kids)),
+          'BreakStatement': (LABELKEYS, Block.expandcontrol, lambda x, kids: Action(None, Action.Break)),
+          'ContinueStatement': (LABELKEYS, Block.expandcontrol, lambda x, kids: Action(None, Action.Continue)),
+          'WhileStatement': (WHILEKEYS, lambda x: (x['test'], x['body']), lambda x, kids: Loop.buildwhile(x, kids, Loop.While)),
+          'DoWhileStatement': (WHILEKEYS, lambda x: (x['test'], x['body']), lambda x, kids: Loop.buildwhile(x, kids, Loop.DoWhile)),
+          'TryStatement': (TRYKEYS, Handler.expand, Handler.build),
+          'CallExpression': (CALLKEYS, Call.expand, lambda x, kids: Call.build(x, kids, Call.call)),
+          'NewExpression': (CALLKEYS, Call.expand, lambda x, kids: Call.build(x, kids, Call.new)),
+          'FunctionExpression': (FUNCTIONKEYS, Function.expand, lambda x, kids: Function.build(x, kids, Function.inline)),
+          'MemberExpression': (MEMBERKEYS, lambda x: (x['object'], x['property']), Expression.buildmember),
+          'ThisExpression': (NOKEYS, nochildren, lambda x, kids: THISOPERAND),
+          'BinaryExpression': (BINARYKEYS, lambda x: (x['left'], x['right']), lambda x, kids: GeneralOperation(sys.intern(x['operator']), kids[0], kids[1])),
+          'AssignmentExpression': (BINARYKEYS, lambda x: (x['left'], x['right']), lambda x, kids: Assignment(sys.intern(x['operator']), kids[0], kids[1])),
+          'LogicalExpression': (BINARYKEYS, lambda x: (x['left'], x['right']), lambda x, kids: LogicalOperation(sys.intern(x['operator']), kids[0], kids[1])),
+          'ConditionalExpression': (CONDITIONALKEYS, lambda x: (x['test'], x['consequent'], x['alternate']), lambda x, kids: ConditionalExpression(*kids)),
+          'UnaryExpression': (MODIFIERKEYS, lambda x: (x['argument'],), lambda x, kids: Modifier(sys.intern(x['operator']), kids[0], x['prefix'])),
+          'UpdateExpression': (MODIFIERKEYS, lambda x: (x['argument'],), lambda x, kids: Modifier(sys.intern(x['operator']), kids[0], x['prefix'])),
+          'ArrayExpression': (ELEMENTSKEYS, lambda x: x['elements'], lambda x, kids: Combinator.build(kids, '[]')),
+          'SequenceExpression': (EXPRESSIONSKEYS, lambda x: x['expressions'], lambda x, kids: Combinator.build(kids, None)),
+          'ObjectExpression': (OBJECTKEYS, Object.expand, Object.build) }
+
+def loadnodes(astnodes):
+    operands = {}
+    lookup = dict(LOADS,
+          Literal = (LITERALKEYS, nochildren, lambda x, kids: Expression.buildliteral(x, operands)),
+          Identifier = (NAMEKEYS, nochildren, lambda x, kids: Expression.buildidentifier(x, operands)) ).get
+    check = checknode
+    nokids = NOKIDS
+
+    def loadnode(astnode):
+        if astnode == None:
+            return None
+        t = astnode['type']
+        entry = lookup(t)
+        if entry == None:
+            print(astnode)
+            raise Exception('Unknown node type ' + t)
+        keys, expand, build = entry
+        if __debug__:
+            check(astnode, keys)
+        kids = expand(astnode)
+        if len(kids) == 0:
+            return build(astnode, nokids)
+        return build(astnode, list(map(loadnode, kids)))
+
+    return list(map(loadnode, astnodes))
+
 def load(jssource):
+    return loadprogram(parse(jssource))
+
+def loadfile(filename, cache = False):
+    return loadprogram(parsefile(filename, cache))
+
+def parsefile(filename, cache = False):
+    with open(filename) as jsfile:
+        jssource = jsfile.read()
+    if not cache:
+        return parse(jssource)
+    digest = hashlib.sha1(jssource.encode()).hexdigest()
+    cachename = filename + '.jsast'
+    try:
+        with open(cachename) as cachefile:
+            cached = json.load(cachefile)
+        if cached['hash'] == digest and type(cached['ast']) is dict:
+            return cached['ast']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
     ast = parse(jssource)
+    tempname = cachename + '.' + str(os.getpid())
+    try:
+        with open(tempname, 'w') as cachefile:
+            json.dump({ 'hash': digest, 'ast': ast }, cachefile)
+        os.replace(tempname, cachename)
+    except OSError:
+        try:
+            os.remove(tempname)
+        except OSError:
+            pass
+    return ast
+
+def loadprogram(ast):
     if ast['type'] != 'Program':
         raise Exception('Invalid AST ' + ast['type'])
     else:
@@ -588,5 +879,4 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Reads a javascript file')
     parser.add_argument('js', help='a js file')
     args = parser.parse_args()
-    with open(args.js) as jsfile:
-        load(jsfile.read())
+    loadfile(args.js)
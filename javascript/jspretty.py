@@ -6,8 +6,8 @@ import jsparser
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Pretty prints a javascript file')
     parser.add_argument('js', help='a js file')
+    parser.add_argument('--cache', action='store_true', help='keeps the parsed AST in a .jsast file next to the js file')
     args = parser.parse_args()
-    with open(args.js) as jsfile:
-        rules = jsparser.Rules()
-        jsprog = jsparser.load(jsfile.read())
-        print(jsprog.pretty(rules))
\ No newline at end of file
+    rules = jsparser.Rules()
+    jsprog = jsparser.loadfile(args.js, args.cache)
+    print(jsprog.pretty(rules))
\ No newline at end of file
@@ -0,0 +1,5 @@
+f(a, b, c);
+new g(1, 'two', [ 3, 4 ]);
+x = [ a, b + 1, [], [ c ] ];
+for (var i = 0, j = 10; i < j; i++) { h(i, j); }
+for (i = 0, j = 1; i < 3; i++) { }
@@ -1,5 +1,6 @@
 #!/usr/bin/python3
 
+import sys
 import importlib
 import argparse
 
@@ -8,7 +9,8 @@ class ModuleDump:
         pass
 
     def dump(self, modname):
-        importlib.import_module(modname)
+        if modname not in sys.modules:
+            importlib.import_module(modname)
         buf = '# ' + modname
         return buf
 